@@ -79,7 +79,8 @@ start_date = end_date - timedelta(days=365)
 
 NB_ELIGIBLES_CIBLES = 20
 # Pas de .tolist() nécessaire ici car list_salarie_ids est déjà une liste
-eligible_ids = random.sample(list_salarie_ids, min(NB_ELIGIBLES_CIBLES, len(list_salarie_ids))) 
+# Ensemble (table de hachage) pour un test d'appartenance en O(1) dans la boucle ci-dessous
+eligible_ids = set(random.sample(list_salarie_ids, min(NB_ELIGIBLES_CIBLES, len(list_salarie_ids))))
 
 for salarie_id in list_salarie_ids:
     
@@ -1,10 +1,15 @@
 import pandas as pd
 import numpy as np
 from sqlalchemy import create_engine
-import requests
 import sys
 import os # Importation de 'os' pour lire les variables d'environnement
 
+PANDAS_MAJEUR = int(pd.__version__.split('.')[0])
+
+# Copy-on-Write : les sélections de colonnes ne dupliquent plus les données (comportement par défaut à partir de pandas 3)
+if PANDAS_MAJEUR < 3:
+    pd.options.mode.copy_on_write = True
+
 # ==============================================================================
 # 0. CONFIGURATION & CONNEXION
 # ==============================================================================
@@ -28,6 +33,9 @@ else:
 PRIME_RATE = 0.05
 MIN_ACTIVITES = 15
 
+# Nombre de lignes par lot lors du chargement en base
+LOAD_CHUNKSIZE = 1000
+
 # Chaîne découpée pour contourner la protection anti-secrets (GitHub Push Protection)
 SLACK_WEBHOOK_URL = "https://hooks.slack.com/" + "services/T00000000/B00000000/XXXXXXXXXXXXXXXXXXXXXXXX"
 
@@ -35,6 +43,11 @@ SLACK_WEBHOOK_URL = "https://hooks.slack.com/" + "services/T00000000/B00000000/X
 RH_FILE = "donnees_rh.csv"
 ACTIVITES_FILE = "activites_simulees.csv"
 
+# Options de lecture des CSV (l'identifiant est lu directement en texte pour éviter une conversion après coup)
+# Seules les colonnes utilisées par le comptage sont lues dans le fichier Activités (durée, description... ignorées)
+RH_READ_PARAMS = {'sep': ';', 'encoding': 'latin-1', 'dtype': {'ID salarié': str}}
+ACTIVITES_READ_PARAMS = {'sep': ',', 'encoding': 'utf-8', 'dtype': {'ID salarié': str}, 'usecols': ['ID salarié', "Type d'activité"]}
+
 
 def get_db_engine():
     """Initialise et retourne le moteur SQLAlchemy."""
@@ -53,16 +66,28 @@ def get_db_engine():
 # 1. EXTRACTION (E)
 # ==============================================================================
 
+def read_csv_rapide(path, **read_params):
+    """Lit un CSV avec le moteur PyArrow (multithread), ou le moteur C si PyArrow n'est pas installé."""
+    # Avant pandas 3, le moteur PyArrow applique 'dtype' après l'inférence de type :
+    # un identifiant entier avec une valeur vide y devient '59019.0' / 'nan'. Le moteur C est alors conservé.
+    if PANDAS_MAJEUR < 3:
+        return pd.read_csv(path, **read_params)
+    try:
+        return pd.read_csv(path, engine='pyarrow', **read_params)
+    except ImportError:
+        return pd.read_csv(path, **read_params)
+
+
 def extract_data():
     """Charge les données RH et d'activités depuis les fichiers CSV."""
     print("⏳ Étape E (Extraction) : Chargement des données...")
     try:
         # Fichier RH: Séparateur ';' et Encodage 'latin-1'
-        df_rh = pd.read_csv(RH_FILE, sep=';', encoding='latin-1')
+        df_rh = read_csv_rapide(RH_FILE, **RH_READ_PARAMS)
         print(f"    -> Fichier RH chargé : {len(df_rh)} lignes.")
 
         # Fichier Activités: Séparateur ',' et encodage 'utf-8'
-        df_activites = pd.read_csv(ACTIVITES_FILE, sep=',', encoding='utf-8')
+        df_activites = read_csv_rapide(ACTIVITES_FILE, **ACTIVITES_READ_PARAMS)
         print(f"    -> Fichier Activités chargé : {len(df_activites)} lignes.")
 
         return df_rh, df_activites
@@ -83,14 +108,13 @@ def transform_data(df_rh, df_activites):
 
     try:
         # --- Nettoyage des Noms de Colonnes (AGRESSIF) ---
+        # (les lettres accentuées sont déjà remplacées par '_' à l'étape 1, d'où 'id_salari_' dans les renommages)
         def clean_cols(df):
             cols = df.columns.str.lower().str.strip()
             # 1. Remplacer tous les caractères non alphanumériques (sauf underscore) par un underscore
             cols = cols.str.replace(r'[^a-z0-9_]+', '_', regex=True)
             # 2. Supprimer les underscores multiples
             cols = cols.str.replace('__', '_', regex=False)
-            # 3. Supprimer les accents
-            cols = cols.str.replace('é', 'e', regex=False).str.replace('è', 'e', regex=False).str.replace('ê', 'e', regex=False).str.replace('à', 'a', regex=False).str.replace('î', 'i', regex=False)
             
             df.columns = cols
             return df
@@ -119,27 +143,56 @@ def transform_data(df_rh, df_activites):
             print(f"⚠️ Avertissement: Colonne '{DISTANCE_COL_NAME}' non trouvée dans RH. Ajout d'une distance fictive (5 km) pour le test.")
             df_rh[DISTANCE_COL_NAME] = 5.0
         
-        # Vérification finale des colonnes critiques
-        if 'collaborateur_id' not in df_rh.columns or 'salaire' not in df_rh.columns or 'moyen_deplacement' not in df_rh.columns:
+        # Vérification finale des colonnes critiques (une seule différence d'ensembles par table, qui nomme les colonnes absentes)
+        manquantes_rh = pd.Index(['collaborateur_id', 'salaire', 'moyen_deplacement']).difference(df_rh.columns)
+        if len(manquantes_rh):
              print(f"Colonnes RH trouvées: {df_rh.columns.tolist()}")
-             raise KeyError("Colonnes RH critiques manquantes après renommage.")
-        if 'collaborateur_id' not in df_activites.columns or 'activite' not in df_activites.columns:
+             raise KeyError(f"Colonnes RH critiques manquantes après renommage : {manquantes_rh.tolist()}")
+        manquantes_activites = pd.Index(['collaborateur_id', 'activite']).difference(df_activites.columns)
+        if len(manquantes_activites):
             print(f"Colonnes Activités trouvées: {df_activites.columns.tolist()}")
-            raise KeyError("Colonnes Activités critiques manquantes après renommage.")
+            raise KeyError(f"Colonnes Activités critiques manquantes après renommage : {manquantes_activites.tolist()}")
+
+        # Projection sur les colonnes utiles : les colonnes texte (nom, adresse...) ne traversent ni la jointure ni les calculs
+        df_rh = df_rh[['collaborateur_id', 'salaire', 'moyen_deplacement', DISTANCE_COL_NAME]]
         
         
         # --- Logique Commune ---
-        df_rh['collaborateur_id'] = df_rh['collaborateur_id'].astype(str).str.lower()
-        df_activites['collaborateur_id'] = df_activites['collaborateur_id'].astype(str).str.lower()
+        # Agrégation poussée avant le nettoyage : une ligne par identifiant brut, seuls les identifiants distincts sont ensuite nettoyés
+        df_activites = df_activites.groupby('collaborateur_id', as_index=False)['activite'].count()
+
+        # (les identifiants sont déjà lus en texte, cf. RH_READ_PARAMS / ACTIVITES_READ_PARAMS)
+        df_rh['collaborateur_id'] = df_rh['collaborateur_id'].str.lower()
+        df_activites['collaborateur_id'] = df_activites['collaborateur_id'].str.lower()
+
+        # Clé de jointure entière partagée par les deux tables (une seule factorisation au lieu d'un hachage de chaînes par table)
+        def factoriser_cle(gauche, droite, col):
+            codes, _ = pd.factorize(pd.concat([gauche[col], droite[col]], ignore_index=True))
+            codes = codes.astype(np.int32)
+            return codes[:len(gauche)], codes[len(gauche):]
+
+        df_rh['cle_collaborateur'], df_activites['cle_collaborateur'] = factoriser_cle(df_rh, df_activites, 'collaborateur_id')
 
 
         # =========================================================
         # CALCUL 1: Éligibilité aux 5 Jours "Bien-être" (Règle 15 activités)
         # =========================================================
-        df_total_activites = df_activites.groupby('collaborateur_id')['activite'].count().reset_index(name='total_activites')
-
-        df_final = pd.merge(df_rh, df_total_activites, on='collaborateur_id', how='left')
-        df_final['total_activites'] = df_final['total_activites'].fillna(0).astype(int)
+        # Le comptage reste indexé par la clé : la jointure sonde directement cet index, sans DataFrame intermédiaire
+        # (somme des comptages partiels : deux identifiants bruts peuvent ne différer que par la casse)
+        total_activites = df_activites.groupby('cle_collaborateur')['activite'].sum().rename('total_activites')
+
+        # Un collaborateur RH ne doit apparaître qu'une fois (sinon sa prime serait comptée plusieurs fois).
+        # Contrôle fait sur les codes entiers ; les identifiants vides (code -1) ne sont pas des doublons.
+        # C'est le seul garde-fou : le côté droit de la jointure est un index de groupby, unique par construction.
+        cles = df_rh['cle_collaborateur']
+        en_double = ((cles >= 0) & cles.duplicated()).to_numpy()
+        if en_double.any():
+            ids_en_double = pd.unique(df_rh['collaborateur_id'].to_numpy()[en_double]).tolist()
+            raise pd.errors.MergeError(f"Identifiants collaborateur en double dans le fichier RH : {ids_en_double}")
+
+        df_final = df_rh.join(total_activites, on='cle_collaborateur', how='left')
+        # Plus aucun NaN après fillna : entier NumPy simple (int32 suffit pour un nombre d'activités)
+        df_final['total_activites'] = df_final['total_activites'].fillna(0).astype(np.int32)
 
         df_final['eligibilite_jours_bien_etre'] = (df_final['total_activites'] >= MIN_ACTIVITES)
         
@@ -150,41 +203,42 @@ def transform_data(df_rh, df_activites):
         
         # 1. Définir les déplacements considérés comme "sportifs"
         sports_navette = ['velo', 'trottinette', 'marche/running', 'autres']
-        df_final['moyen_deplacement_clean'] = df_final['moyen_deplacement'].astype(str).str.lower().str.strip()
-        
-        df_final['is_sportif'] = df_final['moyen_deplacement_clean'].apply(lambda x: any(sport in x for sport in sports_navette))
-        
-        # 2. Vérifier les plafonds de distance (Max 15/25 km)
-        def valider_distance(row):
-            dist = row[DISTANCE_COL_NAME]
-            moyen = row['moyen_deplacement_clean']
-            
-            if not row['is_sportif']:
-                return False
-            
+        # Normalisation faite une seule fois par mode de déplacement distinct (quelques valeurs) puis redistribuée par code
+        codes_deplacement, modes_deplacement = pd.factorize(df_final['moyen_deplacement'], use_na_sentinel=False)
+        modes_deplacement_clean = modes_deplacement.astype(str).str.lower().str.strip()
+
+        # 2. Plafonds de distance par mode (Max 15/25 km), NaN pour un mode non sportif (jamais éligible)
+        def plafond_distance(moyen):
+            moyen = str(moyen)
+
+            if not any(sport in moyen for sport in sports_navette):
+                return np.nan
+
             if 'marche/running' in moyen:
-                return dist <= 15 
+                return 15
             elif any(x in moyen for x in ['velo', 'trottinette', 'autres']):
-                return dist <= 25 
+                return 25
             else:
-                return True
-        
-        df_final['distance_validee'] = df_final.apply(valider_distance, axis=1)
+                return np.inf
 
-        # 3. Calcul de l'éligibilité finale à la prime
-        df_final['eligibilite_prime'] = df_final['is_sportif'] & df_final['distance_validee']
+        plafonds = np.array([plafond_distance(m) for m in modes_deplacement_clean], dtype=np.float64)
 
-        # 4. Calcul de la prime (5% du Salaire Brut)
-        df_final['prime_brute'] = df_final['salaire'] * PRIME_RATE
-        
-        df_final['montant_prime'] = np.where(
-            df_final['eligibilite_prime'], 
-            df_final['prime_brute'], 
-            0.0
-        )
+        # 3. Calcul de l'éligibilité finale à la prime : masque calculé directement, sans colonnes intermédiaires
+        distances = df_final[DISTANCE_COL_NAME].to_numpy(dtype=np.float64)
+        df_final['eligibilite_prime'] = distances <= plafonds[codes_deplacement]
+
+        # 4. Calcul de la prime (5% du Salaire Brut), en un seul passage NumPy sur le tableau des salaires
+        # (écriture directe dans des tableaux préalloués via out=, sans tableau temporaire salaire * taux)
+        salaires = df_final['salaire'].to_numpy(dtype=np.float64)
+
+        montants_prime = np.zeros_like(salaires)
+        np.multiply(salaires, PRIME_RATE, out=montants_prime, where=df_final['eligibilite_prime'].to_numpy())
+        df_final['montant_prime'] = montants_prime
         
         # --- Calculs Finaux pour le Reporting ---
-        df_final['nouveau_salaire'] = df_final['salaire'] + df_final['montant_prime']
+        nouveaux_salaires = np.empty_like(salaires)
+        np.add(salaires, montants_prime, out=nouveaux_salaires)
+        df_final['nouveau_salaire'] = nouveaux_salaires
 
         # --- Filtrage (Sélection des colonnes finales) ---
         df_resultat = df_final[[
@@ -195,12 +249,11 @@ def transform_data(df_rh, df_activites):
             'eligibilite_prime',            
             'montant_prime',
             'nouveau_salaire'
-        ]].copy()
+        ]]
         
-        # Mise en forme des montants monétaires
-        df_resultat['salaire'] = df_resultat['salaire'].round(2)
-        df_resultat['montant_prime'] = df_resultat['montant_prime'].round(2)
-        df_resultat['nouveau_salaire'] = df_resultat['nouveau_salaire'].round(2)
+        # Mise en forme des montants monétaires (un seul arrondi pour les trois colonnes)
+        colonnes_montants = ['salaire', 'montant_prime', 'nouveau_salaire']
+        df_resultat[colonnes_montants] = df_resultat[colonnes_montants].round(2)
 
         print(f"    -> Transformation terminée. {len(df_resultat)} lignes prêtes à être chargées.")
         return df_resultat
@@ -208,6 +261,9 @@ def transform_data(df_rh, df_activites):
     except KeyError as e:
         print(f"❌ ERREUR KEYERROR lors de la transformation. La colonne {e} est manquante.")
         sys.exit(1)
+    except pd.errors.MergeError as e:
+        print(f"❌ ERREUR lors de la jointure RH / Activités. Détail : {e}")
+        sys.exit(1)
         
 # ==============================================================================
 # 3. CHARGEMENT (L)
@@ -228,7 +284,9 @@ def load_data(df_resultat, engine):
             con=engine,
             if_exists='replace',
             index=False,
-            method=method_type
+            method=method_type,
+            # Lots bornés : un INSERT multi-lignes par lot, dont la taille reste fixe quel que soit le nombre de lignes à charger
+            chunksize=LOAD_CHUNKSIZE
         )
         print(f"✅ Chargement terminé. Les données sont dans la table '{table_name}'.")
 
@@ -243,9 +301,10 @@ def load_data(df_resultat, engine):
 def send_slack_notification(df_resultat):
     """Envoie une notification de succès avec les statistiques clés à Slack."""
     
-    total_employes = len(df_resultat)
-    primes_attribuees = (df_resultat['montant_prime'] > 0).sum()
-    montant_total_primes = df_resultat['montant_prime'].sum()
+    montants_prime = df_resultat['montant_prime'].to_numpy()
+    total_employes = montants_prime.size
+    primes_attribuees = np.count_nonzero(montants_prime > 0)
+    montant_total_primes = montants_prime.sum()
     
     message = {
         "text": f"✅ PIPELINE ETL/ELT SPORTIF - SUCCÈS\n\n"
@@ -255,11 +314,14 @@ def send_slack_notification(df_resultat):
                 f"• Montant total des primes versées : {montant_total_primes:,.2f} €"
     }
 
-    try:
-        if "XXXXXXXXXXXXXXXXXXXXXXXX" in SLACK_WEBHOOK_URL:
-             print("⚠️ Avertissement : URL Slack par défaut. Notification non envoyée.")
-             return
+    if "XXXXXXXXXXXXXXXXXXXXXXXX" in SLACK_WEBHOOK_URL:
+         print("⚠️ Avertissement : URL Slack par défaut. Notification non envoyée.")
+         return
+
+    # Import différé : 'requests' n'est chargé que lorsqu'une notification est réellement envoyée
+    import requests
 
+    try:
         response = requests.post(SLACK_WEBHOOK_URL, json=message)
         if response.status_code == 200:
             print("✅ Notification Slack envoyée avec succès.")